@@ -337,7 +337,7 @@ try {
     Write-Success "Stage 7 completed in $($Stage7Duration.TotalSeconds.ToString('F1'))s"
     
     $OutputCSV = "$OutputBase/final/${DocumentID}_extractions.csv"
-    $MasterCSV = "$OutputBase/final/extractions_for_bq.csv"
+    $MasterCSV = "$OutputBase/final/extractions_for_bq.csv.gz"
     
 } catch {
     Write-Error-Custom "Stage 7 failed: $_"
@@ -156,7 +156,9 @@ class KPIExtractor:
             if 'extractions' in result:
                 for extraction in result['extractions']:
                     if 'extraction_id' not in extraction:
-                        extraction['extraction_id'] = generate_extraction_id()
+                        extraction['extraction_id'] = generate_extraction_id(
+                            use_uuid=self.settings.get('legacy_uuid_extraction_ids', False)
+                        )
             
             return result
             
@@ -160,7 +160,9 @@ class VastKPIExtractor:
                     if 'extractions' in extraction_result:
                         for extraction in extraction_result['extractions']:
                             if 'extraction_id' not in extraction:
-                                extraction['extraction_id'] = generate_extraction_id()
+                                extraction['extraction_id'] = generate_extraction_id(
+                                    use_uuid=self.settings.get('legacy_uuid_extraction_ids', False)
+                                )
                     
                     # Save to file
                     output_file = os.path.join(
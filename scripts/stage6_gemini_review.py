@@ -8,6 +8,9 @@ import sys
 import logging
 import json
 import time
+import random
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from scripts.utils import (
@@ -17,6 +20,38 @@ from scripts.utils import (
 
 logger = logging.getLogger(__name__)
 
+# Gemini structured-output schema for a single review decision
+REVIEW_RESPONSE_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'review_decision': {'type': 'STRING', 'enum': ['CORRECT', 'INCORRECT', 'AMBIGUOUS']},
+        'corrected_value': {'type': 'NUMBER', 'nullable': True},
+        'gemini_confidence': {'type': 'NUMBER'},
+        'reasoning': {'type': 'STRING'},
+        'additional_context_needed': {'type': 'STRING'}
+    },
+    'required': ['review_decision', 'gemini_confidence', 'reasoning']
+}
+
+# Schema for several extractions from the same page reviewed in one call
+BATCH_REVIEW_RESPONSE_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'reviews': {
+            'type': 'ARRAY',
+            'items': {
+                'type': 'OBJECT',
+                'properties': {
+                    'extraction_id': {'type': 'STRING'},
+                    **REVIEW_RESPONSE_SCHEMA['properties']
+                },
+                'required': ['extraction_id'] + REVIEW_RESPONSE_SCHEMA['required']
+            }
+        }
+    },
+    'required': ['reviews']
+}
+
 class GeminiReviewer:
     """
     Review flagged extractions using Gemini
@@ -33,6 +68,14 @@ class GeminiReviewer:
         
         self.images_dir = self.manifest['output_directory']
         
+        # Client-side rate limit (requests per minute) and retry policy
+        self.min_interval = 60.0 / self.settings.get('gemini_rpm', 60)
+        self.max_retries = 5
+        self._next_call_at = 0.0
+        
+        # Max extractions sent with one page image before splitting the call
+        self.max_batch_size = self.settings.get('gemini_review_batch_size', 8)
+        
         # Identify items needing review
         self.needs_review = self._identify_review_items()
     
@@ -40,20 +83,18 @@ class GeminiReviewer:
         """
         Identify extractions needing Gemini review
         """
-        needs_review = []
+        # Criteria for review (cheapest check first):
+        # 1. Low confidence after verification
+        # 2. Verification status is FLAGGED
+        # 3. Explicitly flagged
+        threshold = self.confidence_threshold
         
-        for extraction in self.extractions:
-            # Criteria for review:
-            # 1. Explicitly flagged
-            # 2. Low confidence after verification
-            # 3. Verification status is FLAGGED
-            
-            if extraction.get('flags', {}).get('needs_review', False):
-                needs_review.append(extraction)
-            elif extraction.get('verification_status') == 'FLAGGED':
-                needs_review.append(extraction)
-            elif extraction.get('confidence', 1.0) < self.confidence_threshold:
-                needs_review.append(extraction)
+        needs_review = [
+            e for e in self.extractions
+            if e.get('confidence', 1.0) < threshold
+            or e.get('verification_status') == 'FLAGGED'
+            or e.get('flags', {}).get('needs_review', False)
+        ]
         
         return needs_review
     
@@ -75,27 +116,45 @@ class GeminiReviewer:
             'still_ambiguous': 0
         }
         
-        for i, extraction in enumerate(self.needs_review):
-            logger.info(f"Reviewing {i+1}/{len(self.needs_review)}: {extraction.get('kpi_name')}...")
+        # Group flagged items by page so each page image is sent once
+        pages = defaultdict(list)
+        for extraction in self.needs_review:
+            pages[extraction.get('source', {}).get('page', 0)].append(extraction)
+        
+        batches = [
+            (page_num, group[start:start + self.max_batch_size])
+            for page_num, group in pages.items()
+            for start in range(0, len(group), self.max_batch_size)
+        ]
+        
+        # Read the next page image while the current Gemini call is in flight
+        with ThreadPoolExecutor(max_workers=1) as prefetcher:
+            next_image = prefetcher.submit(self._load_image, batches[0][0])
             
-            try:
-                review = self._review_extraction(extraction)
-                reviewed_map[extraction['extraction_id']] = review
+            for i, (page_num, batch) in enumerate(batches):
+                logger.info(f"Reviewing page {page_num} ({len(batch)} items, call {i+1}/{len(batches)})...")
                 
-                decision = review.get('review_decision', 'AMBIGUOUS')
-                if decision == 'CORRECT':
-                    review_stats['confirmed'] += 1
-                elif decision == 'INCORRECT':
-                    review_stats['corrected'] += 1
-                else:
-                    review_stats['still_ambiguous'] += 1
+                image_future = next_image
+                if i + 1 < len(batches) and batches[i + 1][0] != page_num:
+                    next_image = prefetcher.submit(self._load_image, batches[i + 1][0])
                 
-                # Rate limiting
-                time.sleep(2)
+                try:
+                    reviews = self._review_batch(batch, image_future.result())
+                except Exception as e:
+                    logger.error(f"Error reviewing page {page_num}: {e}")
+                    continue
                 
-            except Exception as e:
-                logger.error(f"Error reviewing extraction: {e}")
-                continue
+                for extraction in batch:
+                    review = reviews[extraction['extraction_id']]
+                    reviewed_map[extraction['extraction_id']] = review
+                    
+                    decision = review.get('review_decision', 'AMBIGUOUS')
+                    if decision == 'CORRECT':
+                        review_stats['confirmed'] += 1
+                    elif decision == 'INCORRECT':
+                        review_stats['corrected'] += 1
+                    else:
+                        review_stats['still_ambiguous'] += 1
         
         # Apply reviews
         final_extractions = self._apply_reviews(self.extractions, reviewed_map)
@@ -107,22 +166,57 @@ class GeminiReviewer:
         
         return final_extractions, review_stats
     
-    def _review_extraction(self, extraction):
+    def _load_image(self, page_num):
         """
-        Review a single extraction with Gemini
+        Read a page image (None if missing)
         """
-        page_num = extraction.get('source', {}).get('page', 0)
         image_path = os.path.join(self.images_dir, f"page_{page_num:03d}.png")
         
         if not os.path.exists(image_path):
             logger.warning(f"Image not found for review: {image_path}")
+            return None
+        
+        with open(image_path, 'rb') as f:
+            return f.read()
+    
+    def _review_batch(self, batch, image_data):
+        """
+        Review extractions sharing a page image in a single Gemini call
+        
+        Returns:
+            dict: extraction_id -> review
+        """
+        if len(batch) == 1:
+            extraction = batch[0]
+            return {extraction['extraction_id']: self._review_extraction(extraction, image_data)}
+        
+        if image_data is None:
+            return {e['extraction_id']: {'review_decision': 'AMBIGUOUS'} for e in batch}
+        
+        prompt = self._build_batch_review_prompt(batch)
+        result = self._call_gemini(image_data, prompt, BATCH_REVIEW_RESPONSE_SCHEMA)
+        
+        if 'reviews' not in result:
+            # API or parse failure - same AMBIGUOUS fallback for every item
+            return {e['extraction_id']: result for e in batch}
+        
+        by_id = {str(r.get('extraction_id')): r for r in result['reviews']}
+        missing = {'review_decision': 'AMBIGUOUS', 'reasoning': 'No decision returned for this item'}
+        
+        return {e['extraction_id']: by_id.get(str(e['extraction_id']), missing) for e in batch}
+    
+    def _review_extraction(self, extraction, image_data):
+        """
+        Review a single extraction with Gemini
+        """
+        if image_data is None:
             return {'review_decision': 'AMBIGUOUS'}
         
         # Build prompt
         prompt = self._build_review_prompt(extraction)
         
         # Call Gemini
-        result = self._call_gemini(image_path, prompt)
+        result = self._call_gemini(image_data, prompt)
         
         return result
     
@@ -169,7 +263,62 @@ OUTPUT JSON ONLY:
         
         return prompt
     
-    def _call_gemini(self, image_path, prompt):
+    def _build_batch_review_prompt(self, extractions):
+        """
+        Build review prompt for several extractions from the same page
+        """
+        items = [
+            {
+                'extraction_id': str(e.get('extraction_id')),
+                'kpi_name': e.get('kpi_name'),
+                'value': e.get('value_numeric'),
+                'unit': e.get('unit'),
+                'fiscal_year': e.get('fiscal_year'),
+                'confidence': e.get('confidence'),
+                'issue': e.get('verification_notes', 'Low confidence')
+            }
+            for e in extractions
+        ]
+        
+        prompt = f"""You are a financial analyst reviewing AI-extracted data.
+
+CONTEXT:
+An AI extracted these KPIs from the same page but flagged them for review due to uncertainty.
+
+EXTRACTIONS:
+{json.dumps({'extractions': items}, indent=2, ensure_ascii=False)}
+
+PAGE IMAGE:
+[Image attached]
+
+TASK:
+For EACH extraction:
+1. Review the page image
+2. Determine if the extraction is:
+   - CORRECT (confirm value + reasoning)
+   - INCORRECT (provide corrected value + reasoning)
+   - AMBIGUOUS (explain why it cannot be determined)
+
+3. If ambiguous, suggest what additional context would help
+
+OUTPUT JSON ONLY (one review per extraction, echoing its extraction_id):
+{{
+  "reviews": [
+    {{
+      "extraction_id": "...",
+      "review_decision": "CORRECT" | "INCORRECT" | "AMBIGUOUS",
+      "corrected_value": null | {{value}},
+      "gemini_confidence": 0.0-1.0,
+      "reasoning": "...",
+      "additional_context_needed": "..." (if ambiguous)
+    }}
+  ]
+}}
+"""
+        
+        return prompt
+    
+    def _call_gemini(self, image_data, prompt, response_schema=REVIEW_RESPONSE_SCHEMA):
         """
         Call Gemini for review
         """
@@ -178,31 +327,54 @@ OUTPUT JSON ONLY:
             
             genai.configure(api_key=self.settings['gemini_api_key'])
             
-            with open(image_path, 'rb') as f:
-                image_data = f.read()
-            
-            model = genai.GenerativeModel('gemini-2.0-flash')
+            # Structured output returns bare JSON, so no fence stripping is needed
+            model = genai.GenerativeModel(
+                'gemini-2.0-flash',
+                generation_config=genai.GenerationConfig(
+                    response_mime_type='application/json',
+                    response_schema=response_schema
+                )
+            )
             
-            response = model.generate_content([
+            response = self._generate_with_retry(model, [
                 prompt,
                 {'mime_type': 'image/png', 'data': image_data}
             ])
             
-            response_text = response.text
-            
-            # Parse JSON
-            if '```json' in response_text:
-                response_text = response_text.split('```json')[1].split('```')[0].strip()
-            elif '```' in response_text:
-                response_text = response_text.split('```')[1].split('```')[0].strip()
-            
-            result = json.loads(response_text)
+            result = json.loads(response.text)
             return result
             
         except Exception as e:
             logger.error(f"Gemini API error: {e}")
             return {'review_decision': 'AMBIGUOUS', 'reasoning': str(e)}
     
+    def _throttle(self):
+        """
+        Space requests at least min_interval apart
+        """
+        now = time.monotonic()
+        if now < self._next_call_at:
+            time.sleep(self._next_call_at - now)
+            now = self._next_call_at
+        self._next_call_at = now + self.min_interval
+    
+    def _generate_with_retry(self, model, contents):
+        """
+        Call Gemini, backing off exponentially (with jitter) when throttled
+        """
+        from google.api_core.exceptions import ResourceExhausted, ServiceUnavailable
+        
+        for attempt in range(self.max_retries):
+            self._throttle()
+            try:
+                return model.generate_content(contents)
+            except (ResourceExhausted, ServiceUnavailable) as e:
+                if attempt == self.max_retries - 1:
+                    raise
+                delay = min(32.0, 2 ** attempt) + random.uniform(0, 1)
+                logger.warning(f"Gemini throttled ({e.__class__.__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+    
     def _apply_reviews(self, extractions, reviewed_map):
         """
         Apply Gemini reviews to extractions
@@ -5,8 +5,9 @@ Convert final JSON to CSV format for BigQuery loading
 
 import os
 import sys
+import csv
+import gzip
 import logging
-import pandas as pd
 from datetime import datetime
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -36,9 +37,6 @@ class CSVExporter:
             row = self._flatten_extraction(extraction)
             rows.append(row)
         
-        # Create DataFrame
-        df = pd.DataFrame(rows)
-        
         # Reorder columns for readability
         column_order = [
             'extraction_id', 'document_id', 'company_name', 'industry',
@@ -55,10 +53,19 @@ class CSVExporter:
         ]
         
         # Only include columns that exist
-        existing_columns = [col for col in column_order if col in df.columns]
-        df = df[existing_columns]
+        columns = [col for col in column_order if rows and col in rows[0]]
         
-        return df
+        return rows, columns
+    
+    @staticmethod
+    def write_csv(f, rows, columns, header=True):
+        """
+        Write flattened rows to an open text file
+        """
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+        if header:
+            writer.writeheader()
+        writer.writerows(rows)
     
     def _flatten_extraction(self, extraction):
         """
@@ -117,37 +124,42 @@ def main(final_json_path, output_dir="output/final", append_to_master=True):
     logger.info(f"=" * 60)
     
     exporter = CSVExporter(final_json_path)
-    df = exporter.export_to_csv()
+    rows, columns = exporter.export_to_csv()
     
     # Save individual document CSV
     output_file = os.path.join(output_dir, f"{exporter.document_id}_extractions.csv")
-    df.to_csv(output_file, index=False)
+    with open(output_file, 'w', encoding='utf-8', newline='') as f:
+        exporter.write_csv(f, rows, columns)
     
     logger.info(f"✓ CSV saved: {output_file}")
-    logger.info(f"  Rows: {len(df)}")
-    logger.info(f"  Columns: {len(df.columns)}")
+    logger.info(f"  Rows: {len(rows)}")
+    logger.info(f"  Columns: {len(columns)}")
     
-    # Append to master CSV
+    # Append to master CSV (gzip members concatenate, so appending is safe;
+    # BigQuery loads *.csv.gz directly)
     if append_to_master:
-        master_file = os.path.join(output_dir, "extractions_for_bq.csv")
+        master_file = os.path.join(output_dir, "extractions_for_bq.csv.gz")
+        exists = os.path.exists(master_file)
+        
+        with gzip.open(master_file, 'at', compresslevel=1, encoding='utf-8', newline='') as f:
+            exporter.write_csv(f, rows, columns, header=not exists)
         
-        if os.path.exists(master_file):
-            # Append
-            df.to_csv(master_file, mode='a', header=False, index=False)
+        if exists:
             logger.info(f"✓ Appended to master CSV: {master_file}")
         else:
-            # Create new
-            df.to_csv(master_file, index=False)
             logger.info(f"✓ Created master CSV: {master_file}")
     
     # Summary statistics
+    confidences = [r['confidence'] for r in rows if r['confidence'] is not None]
+    avg_confidence = sum(confidences) / len(confidences) if confidences else float('nan')
+    
     logger.info(f"\nSummary:")
-    logger.info(f"  Unique KPIs: {df['kpi_name'].nunique()}")
-    logger.info(f"  Fiscal years: {sorted(df['fiscal_year'].unique())}")
-    logger.info(f"  Avg confidence: {df['confidence'].mean():.3f}")
-    logger.info(f"  Needs review: {df['needs_review'].sum()}")
+    logger.info(f"  Unique KPIs: {len({r['kpi_name'] for r in rows})}")
+    logger.info(f"  Fiscal years: {sorted({r['fiscal_year'] for r in rows if r['fiscal_year'] is not None}, key=str)}")
+    logger.info(f"  Avg confidence: {avg_confidence:.3f}")
+    logger.info(f"  Needs review: {sum(1 for r in rows if r['needs_review'])}")
     
-    return df
+    return rows
 
 if __name__ == "__main__":
     import argparse
@@ -3,17 +3,29 @@ Shared utility functions for the extraction pipeline
 """
 
 import os
+import csv
+import copy
 import json
+import time
+import itertools
+import threading
 import logging
 from datetime import datetime
 from pathlib import Path
+from functools import lru_cache
 import uuid
 from colorlog import ColoredFormatter
 
 def setup_logging(log_dir="logs", log_level=logging.INFO):
     """
     Setup colored logging
+    
+    Safe to call more than once: handlers are only attached the first time.
     """
+    logger = logging.getLogger()
+    if getattr(logger, '_pipeline_configured', False):
+        return logger
+    
     os.makedirs(log_dir, exist_ok=True)
     
     log_file = os.path.join(log_dir, f"pipeline_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
@@ -42,26 +54,38 @@ def setup_logging(log_dir="logs", log_level=logging.INFO):
     file_handler.setFormatter(file_formatter)
     
     # Root logger
-    logger = logging.getLogger()
     logger.setLevel(log_level)
     logger.addHandler(console_handler)
     logger.addHandler(file_handler)
+    logger._pipeline_configured = True
     
     return logger
 
+@lru_cache(maxsize=4)
+def _read_settings(abs_path):
+    with open(abs_path, 'r') as f:
+        return json.load(f)
+
 def load_settings(config_path="config/settings.json"):
     """
     Load configuration settings
+    
+    The file is parsed once per absolute path; each caller gets its own deep
+    copy, so mutating nested sections (paths, pilot_config, ...) cannot leak
+    into other callers.
     """
-    with open(config_path, 'r') as f:
-        return json.load(f)
+    return copy.deepcopy(_read_settings(os.path.abspath(config_path)))
+
+@lru_cache(maxsize=4)
+def _read_prompt_template(abs_path):
+    with open(abs_path, 'r', encoding='utf-8') as f:
+        return f.read()
 
 def load_prompt_template(prompt_path="config/universal_prompt.txt"):
     """
-    Load universal prompt template
+    Load universal prompt template (cached per absolute path)
     """
-    with open(prompt_path, 'r', encoding='utf-8') as f:
-        return f.read()
+    return _read_prompt_template(os.path.abspath(prompt_path))
 
 def parse_pdf_filename(filename):
     """
@@ -97,6 +121,20 @@ def parse_pdf_filename(filename):
     except Exception as e:
         return {'valid': False, 'error': str(e)}
 
+_DIRS_CREATED = set()
+_DIRS_LOCK = threading.Lock()
+
+def _ensure_dir(path):
+    """
+    Create a directory once per process, skipping the makedirs call after that
+    """
+    if not path or path in _DIRS_CREATED:
+        return
+    with _DIRS_LOCK:
+        if path not in _DIRS_CREATED:
+            os.makedirs(path, exist_ok=True)
+            _DIRS_CREATED.add(path)
+
 def create_output_directories(base_path="output"):
     """
     Create all required output directories
@@ -114,19 +152,28 @@ def create_output_directories(base_path="output"):
     ]
     
     for d in dirs:
-        os.makedirs(os.path.join(base_path, d), exist_ok=True)
+        _ensure_dir(os.path.join(base_path, d))
+
+_EXTRACTION_COUNTER = itertools.count()
 
-def generate_extraction_id():
+def generate_extraction_id(use_uuid=False):
     """
     Generate unique extraction ID
+    
+    IDs are hex-encoded (timestamp_ms, pid, counter) so they sort in
+    creation order. Pass use_uuid=True for the legacy uuid4 format.
     """
-    return str(uuid.uuid4())
+    if use_uuid:
+        return str(uuid.uuid4())
+    
+    counter = next(_EXTRACTION_COUNTER) & 0xFFFFFFFF
+    return f"{int(time.time() * 1000):013x}{os.getpid() & 0xFFFF:04x}{counter:08x}"
 
 def save_json(data, filepath):
     """
     Save data to JSON file with pretty printing
     """
-    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    _ensure_dir(os.path.dirname(filepath))
     with open(filepath, 'w', encoding='utf-8') as f:
         json.dump(data, f, indent=2, ensure_ascii=False)
 
@@ -137,32 +184,43 @@ def load_json(filepath):
     with open(filepath, 'r', encoding='utf-8') as f:
         return json.load(f)
 
+@lru_cache(maxsize=1)
+def _metadata_index(metadata_csv):
+    """
+    Build a lowercased company name -> metadata index from the CSV
+    """
+    index = {}
+    with open(metadata_csv, 'r', encoding='utf-8-sig', newline='') as f:
+        for row in csv.DictReader(f):
+            # Keep the first row for duplicate names, as the old scan did
+            index.setdefault(row['company_name'].lower(), {
+                'industry': row['industry'],
+                'fiscal_year_end': row['fiscal_year_end']
+            })
+    return index
+
 def get_company_metadata(company_name, metadata_csv="config/company_metadata.csv"):
     """
     Get company metadata from CSV
     """
-    import pandas as pd
-    
     if not os.path.exists(metadata_csv):
         return {
             'industry': 'Unknown',
             'fiscal_year_end': 'March 31'
         }
     
-    df = pd.read_csv(metadata_csv)
+    index = _metadata_index(metadata_csv)
+    key = company_name.lower()
     
     # Try exact match
-    match = df[df['company_name'].str.lower() == company_name.lower()]
+    match = index.get(key)
     
-    if len(match) == 0:
+    if match is None:
         # Try partial match
-        match = df[df['company_name'].str.lower().str.contains(company_name.lower())]
+        match = next((meta for name, meta in index.items() if key in name), None)
     
-    if len(match) > 0:
-        return {
-            'industry': match.iloc[0]['industry'],
-            'fiscal_year_end': match.iloc[0]['fiscal_year_end']
-        }
+    if match is not None:
+        return dict(match)
     
     return {
         'industry': 'Unknown',
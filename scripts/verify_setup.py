@@ -4,12 +4,60 @@ Verifies all prerequisites are installed and configured correctly
 """
 
 import os
+import re
 import sys
+import shutil
+import functools
 import subprocess
 import importlib
+from importlib.metadata import version, PackageNotFoundError
 import json
 from pathlib import Path
 
+_TOOL_SEP = "---SEP---"
+
+# Google API keys: 'AIza' followed by 35 URL-safe characters
+_GEMINI_KEY_RE = re.compile(r'AIza[0-9A-Za-z_\-]{35}')
+
+@functools.cache
+def _tool_versions():
+    """
+    Version output per external tool (None if the tool is not on PATH)
+    
+    Tools are located with shutil.which first, so absent binaries cost no
+    process spawn; the ones found are probed together in a single shell.
+    """
+    candidates = {
+        'ghostscript': ['gswin64c', 'gs'],
+        'poppler': ['pdftoppm'],
+        'docker': ['docker'],
+    }
+    join = f' & echo {_TOOL_SEP} & ' if os.name == 'nt' else f'; echo {_TOOL_SEP}; '
+    
+    flags = {'ghostscript': '--version', 'poppler': '-v', 'docker': '--version'}
+    found = {
+        tool: next((name for name in names if shutil.which(name)), None)
+        for tool, names in candidates.items()
+    }
+    versions = dict.fromkeys(candidates)
+    present = [tool for tool, name in found.items() if name]
+    
+    if not present:
+        return versions
+    
+    script = join.join(f'{found[tool]} {flags[tool]} 2>&1' for tool in present)
+    argv = ['cmd', '/c', script] if os.name == 'nt' else ['sh', '-c', script]
+    
+    try:
+        result = subprocess.run(argv, capture_output=True, text=True, timeout=10)
+        blocks = [b.strip() for b in result.stdout.split(_TOOL_SEP)]
+    except (subprocess.TimeoutExpired, FileNotFoundError):
+        blocks = []
+    
+    blocks += [''] * (len(present) - len(blocks))
+    versions.update(zip(present, blocks))
+    return versions
+
 class SetupVerifier:
     """
     Verify system setup
@@ -19,6 +67,7 @@ class SetupVerifier:
         self.checks_passed = 0
         self.checks_failed = 0
         self.warnings = []
+        self._settings = None
     
     def print_header(self):
         print("=" * 70)
@@ -66,35 +115,48 @@ class SetupVerifier:
     def check_package(self, package_name, import_name=None):
         """
         Check if a Python package is installed
+        
+        Reads the installed distribution's metadata instead of importing it;
+        the import path is only a fallback for packages without metadata
+        (e.g. a differently named distribution providing the same module).
         """
+        try:
+            pkg_version = version(package_name)
+            self.print_check(f"Package: {package_name}", True, f"Version: {pkg_version}")
+            return True
+        except PackageNotFoundError:
+            pass
+        
         if import_name is None:
             import_name = package_name
         
         try:
             module = importlib.import_module(import_name)
-            version = getattr(module, '__version__', 'unknown')
-            self.print_check(f"Package: {package_name}", True, f"Version: {version}")
+            pkg_version = getattr(module, '__version__', 'unknown')
+            self.print_check(f"Package: {package_name}", True, f"Version: {pkg_version}")
             return True
         except ImportError:
             self.print_check(f"Package: {package_name}", False, 
                            f"Not installed. Run: pip install {package_name}")
             return False
     
+    @staticmethod
+    def _tool_missing(output):
+        """
+        True if the tool is not on PATH or its probe produced no usable output
+        """
+        return (not output or 'not recognized' in output
+                or 'not found' in output)
+    
     def check_ghostscript(self):
         """
         Check if Ghostscript is installed
         """
-        try:
-            result = subprocess.run(['gswin64c', 'gs', '--version'], 
-                                  capture_output=True, text=True, timeout=5)
-            if result.returncode == 0:
-                version = result.stdout.strip()
-                self.print_check("Ghostscript", True, f"Version: {version}")
-                return True
-            else:
-                self.print_check("Ghostscript", False, "Not found in PATH")
-                return False
-        except (subprocess.TimeoutExpired, FileNotFoundError):
+        output = _tool_versions()['ghostscript']
+        if not self._tool_missing(output):
+            self.print_check("Ghostscript", True, f"Version: {output}")
+            return True
+        else:
             self.print_check("Ghostscript", False, 
                            "Not installed or not in PATH. Download from ghostscript.com")
             return False
@@ -103,16 +165,11 @@ class SetupVerifier:
         """
         Check if Poppler is installed
         """
-        try:
-            result = subprocess.run(['pdftoppm', '-v'], 
-                                  capture_output=True, text=True, timeout=5)
-            if result.returncode == 0 or 'pdftoppm' in result.stderr:
-                self.print_check("Poppler (pdftoppm)", True, "Found in PATH")
-                return True
-            else:
-                self.print_check("Poppler (pdftoppm)", False, "Not found in PATH")
-                return False
-        except (subprocess.TimeoutExpired, FileNotFoundError):
+        output = _tool_versions()['poppler']
+        if not self._tool_missing(output) and 'pdftoppm' in output:
+            self.print_check("Poppler (pdftoppm)", True, "Found in PATH")
+            return True
+        else:
             self.print_check("Poppler (pdftoppm)", False, 
                            "Not installed. Download from github.com/oschwartz10612/poppler-windows")
             return False
@@ -121,20 +178,22 @@ class SetupVerifier:
         """
         Check if Docker is installed
         """
-        try:
-            result = subprocess.run(['docker', '--version'], 
-                                  capture_output=True, text=True, timeout=5)
-            if result.returncode == 0:
-                version = result.stdout.strip()
-                self.print_check("Docker", True, version)
-                return True
-            else:
-                self.print_check("Docker", False, "Not found")
-                return False
-        except (subprocess.TimeoutExpired, FileNotFoundError):
+        output = _tool_versions()['docker']
+        if not self._tool_missing(output):
+            self.print_check("Docker", True, output)
+            return True
+        else:
             self.print_warning("Docker not installed (optional for pilot, required for production)")
             return False
     
+    def _load_settings(self):
+        """
+        Parse config/settings.json once and share it between checks
+        """
+        if self._settings is None:
+            self._settings = json.loads(Path("config/settings.json").read_text())
+        return self._settings
+    
     def check_settings_file(self):
         """
         Check if settings.json exists and is valid
@@ -147,8 +206,7 @@ class SetupVerifier:
             return False
         
         try:
-            with open(settings_path, 'r') as f:
-                settings = json.load(f)
+            settings = self._load_settings()
             
             # Check required keys
             required_keys = ['gemini_api_key']
@@ -172,11 +230,13 @@ class SetupVerifier:
     
     def check_gemini_api_key(self):
         """
-        Check if Gemini API key is valid
+        Check if Gemini API key looks valid
+        
+        Only the key format is checked; importing google.generativeai just to
+        call configure() cost more than the rest of the verifier combined.
         """
         try:
-            with open("config/settings.json", 'r') as f:
-                settings = json.load(f)
+            settings = self._load_settings()
             
             api_key = settings.get('gemini_api_key', '')
             
@@ -184,17 +244,14 @@ class SetupVerifier:
                 self.print_check("Gemini API key", False, "Not configured in settings.json")
                 return False
             
-            # Try to import and configure (don't actually call API)
-            import google.generativeai as genai
-            genai.configure(api_key=api_key)
+            if not _GEMINI_KEY_RE.fullmatch(api_key):
+                self.print_check("Gemini API key", False, 
+                               "Does not look like a Google API key (expected 'AIza' + 35 characters)")
+                return False
             
-            self.print_check("Gemini API key", True, "Configured (not validated - will check on first use)")
+            self.print_check("Gemini API key", True, "Format valid (not live-tested - will check on first use)")
             return True
             
-        except ImportError:
-            self.print_check("Gemini API key", False, 
-                           "google-generativeai package not installed")
-            return False
         except Exception as e:
             self.print_check("Gemini API key", False, str(e))
             return False
@@ -211,9 +268,15 @@ class SetupVerifier:
             'logs'
         ]
         
+        # One readdir for the top level; nested paths only stat their leaf
+        # when the parent exists
+        with os.scandir('.') as entries:
+            existing = {e.name for e in entries if e.is_dir()}
+        
         missing_dirs = []
         for dir_path in required_dirs:
-            if not os.path.exists(dir_path):
+            top, _, rest = dir_path.partition('/')
+            if top not in existing or (rest and not os.path.isdir(dir_path)):
                 missing_dirs.append(dir_path)
         
         if missing_dirs:
@@ -297,6 +360,8 @@ class SetupVerifier:
             ('pandas', 'pandas'),
             ('numpy', 'numpy'),
             ('requests', 'requests'),
+            ('httpx', 'httpx'),
+            ('h2', 'h2'),
             ('colorlog', 'colorlog'),
         ]
         
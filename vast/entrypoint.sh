@@ -22,8 +22,14 @@ elif [ "$MODE" == "extraction" ] || [ "$MODE" == "verification" ]; then
     MODEL_NAME="Qwen/Qwen2-VL-72B-Instruct"
     if [ "$MODE" == "extraction" ]; then
         SERVER_SCRIPT="extraction_server.py"
+        # Pre-quantized checkpoints (see MODEL_VARIANTS in extraction_server.py)
+        case "${QUANTIZATION:-awq}" in
+            awq) MODEL_NAME="Qwen/Qwen2.5-VL-72B-Instruct-AWQ" ;;
+            *) MODEL_NAME="Qwen/Qwen2.5-VL-72B-Instruct" ;;
+        esac
     else
         SERVER_SCRIPT="verification_server.py"
+        MODEL_NAME="Qwen/Qwen2-VL-72B-Instruct-AWQ"
     fi
 else
     echo "Unknown mode: $MODE"
@@ -31,12 +37,15 @@ else
 fi
 
 # Download model if not cached
+export HF_HOME=${HF_HOME:-/workspace/hf_cache}
 echo "Checking for model: $MODEL_NAME"
-if [ ! -d "/workspace/.cache/huggingface/hub/models--${MODEL_NAME//\//_}" ]; then
+if [ -f "$HF_HOME/prefetched_model" ] && [ "$(cat $HF_HOME/prefetched_model)" == "$MODEL_NAME" ]; then
+    # Weights baked into the image; skip the hub revision check too
+    echo "Model baked into image"
+    export HF_HUB_OFFLINE=1
+elif [ ! -d "$HF_HOME/hub/models--${MODEL_NAME//\//--}" ]; then
     echo "Downloading $MODEL_NAME (this may take 5-15 minutes)..."
-    python3 -c "from transformers import AutoModelForCausalLM, AutoTokenizer; \
-                model = AutoModelForCausalLM.from_pretrained('$MODEL_NAME', device_map='auto'); \
-                tokenizer = AutoTokenizer.from_pretrained('$MODEL_NAME')"
+    huggingface-cli download "$MODEL_NAME"
     echo "Model downloaded successfully"
 else
     echo "Model already cached"
@@ -44,4 +53,4 @@ fi
 
 # Start appropriate server
 echo "Starting $MODE server on port 8000..."
-python3 /workspace/$SERVER_SCRIPT
\ No newline at end of file
+python3 ${SERVER_DIR:-/workspace}/$SERVER_SCRIPT
\ No newline at end of file
@@ -4,51 +4,361 @@ Runs on Vast.ai GPU instances
 """
 
 import os
-import json
-import base64
+import orjson
+import uuid
+import asyncio
+import functools
+import threading
 from io import BytesIO
-from typing import List, Dict, Any
-import torch
-from PIL import Image
-from transformers import Qwen2VLForConditionalGeneration, AutoTokenizer, AutoProcessor
+from typing import List, Optional
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, Field
 import uvicorn
 
 # Initialize FastAPI
-app = FastAPI(title="KPI Extraction Server")
+app = FastAPI(title="KPI Extraction Server", default_response_class=ORJSONResponse)
+
+# Heavy modules (torch, PIL) are imported by load_model(), so that
+# importing this module, --help and uvicorn startup stay fast
+torch = None
+Image = None
 
 # Global model variables
 model = None
 tokenizer = None
 processor = None
 
+# Checkpoint per quantization mode (--quantization / QUANTIZATION env var).
+# awq is Qwen's pre-quantized INT4 checkpoint with fused GEMM kernels;
+# fp8 quantizes the FP16 weights after load (Hopper); int8 is the old
+# bitsandbytes LLM.int8 path, kept for benchmarking.
+MODEL_VARIANTS = {
+    "awq": "Qwen/Qwen2.5-VL-72B-Instruct-AWQ",
+    "fp8": "Qwen/Qwen2.5-VL-72B-Instruct",
+    "int8": "Qwen/Qwen2.5-VL-72B-Instruct",
+}
+QUANTIZATION = os.environ.get("QUANTIZATION", "awq")
+
+# Vision-token budget per page (each token covers a 28x28 pixel patch);
+# the processor resizes pages into this range
+MIN_PIXELS = 256 * 28 * 28
+MAX_PIXELS = 1280 * 28 * 28
+
+# Inference backend (--backend / INFERENCE_BACKEND env var). vllm serves
+# through AsyncLLMEngine (continuous batching, PagedAttention);
+# transformers keeps the plain HF generate path.
+BACKEND = os.environ.get("INFERENCE_BACKEND", "vllm")
+engine = None
+sampling_params = None
+tokenizer_data = None
+
+# Padded attention cost allowed per generate call on the transformers
+# backend (rows x longest prompt^2; default ~ 20 pages of 2k tokens)
+TOKEN_BUDGET = int(os.environ.get("TOKEN_BUDGET", 20 * 2048 ** 2))
+
+# generate() runs in worker threads; one batch on the GPU at a time
+generate_lock = threading.Lock()
+generate_stream = None
+
+# Response schema enforced during decoding; mirrors the extraction fields
+# consumed by stages 4-7
+class KPISource(BaseModel):
+    section: str = ""
+    page: int = 0
+    table_title: str = ""
+    column_label: str = ""
+
+class KPIContext(BaseModel):
+    multi_year_table: bool = False
+
+class KPIFlags(BaseModel):
+    needs_review: bool = False
+
+class KPIExtraction(BaseModel):
+    kpi_name: str
+    kpi_description: str = ""
+    kpi_category: str = ""
+    value_raw: str
+    value_numeric: Optional[float] = None
+    value_actual: Optional[float] = None
+    unit: str = ""
+    currency: str = ""
+    magnitude_unit: str = ""
+    fiscal_year: int = 0
+    is_current_report_year: bool = False
+    source: KPISource = Field(default_factory=KPISource)
+    context: KPIContext = Field(default_factory=KPIContext)
+    confidence: float = 0.0
+    confidence_reasoning: str = ""
+    flags: KPIFlags = Field(default_factory=KPIFlags)
+
+class KPIResponse(BaseModel):
+    extractions: List[KPIExtraction]
+
+KPI_SCHEMA = KPIResponse.model_json_schema()
+
 def load_model():
     """
     Load Qwen2.5-VL-72B model
     """
-    global model, tokenizer, processor
+    global model, tokenizer, processor, tokenizer_data, generate_stream
+    global torch, Image
     
-    print("Loading Qwen2.5-VL-72B model...")
+    import torch
+    from PIL import Image
+    from transformers import Qwen2_5_VLForConditionalGeneration, AutoTokenizer, AutoProcessor
     
-    model_name = "Qwen/Qwen2-VL-72B-Instruct"
+    # TF32 tensor cores for any remaining fp32 matmuls (vision tower norms, LM head)
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.set_float32_matmul_precision("high")
+    
+    print(f"Loading Qwen2.5-VL-72B model ({QUANTIZATION}, {BACKEND})...")
+    
+    model_name = MODEL_VARIANTS[QUANTIZATION]
     
     # Load tokenizer and processor
     tokenizer = AutoTokenizer.from_pretrained(model_name)
-    processor = AutoProcessor.from_pretrained(model_name)
+    processor = AutoProcessor.from_pretrained(model_name, min_pixels=MIN_PIXELS, max_pixels=MAX_PIXELS)
+    
+    # Batched generation needs left padding so every row ends at the same
+    # position and new tokens line up
+    processor.tokenizer.padding_side = "left"
     
-    # Load model with optimizations
-    model = Qwen2VLForConditionalGeneration.from_pretrained(
+    if BACKEND == "vllm":
+        load_vllm_engine(model_name)
+        print("Model loaded successfully")
+        return
+    
+    # Load model with optimizations (the AWQ checkpoint carries its own
+    # quantization config)
+    load_kwargs = {}
+    if QUANTIZATION == "int8":
+        load_kwargs["load_in_8bit"] = True
+    
+    model = Qwen2_5_VLForConditionalGeneration.from_pretrained(
         model_name,
         torch_dtype=torch.float16,
         device_map="auto",
-        load_in_8bit=True  # Use 8-bit quantization to fit in 80GB
+        attn_implementation="flash_attention_2",
+        use_safetensors=True,
+        low_cpu_mem_usage=True,
+        **load_kwargs
     )
     
+    if QUANTIZATION == "fp8":
+        from torchao.quantization import quantize_, float8_dynamic_activation_float8_weight
+        quantize_(model, float8_dynamic_activation_float8_weight())
+    
     model.eval()
     
+    # Token vocabulary index for JSON-constrained decoding, built once
+    from lmformatenforcer.integrations.transformers import build_token_enforcer_tokenizer_data
+    tokenizer_data = build_token_enforcer_tokenizer_data(processor.tokenizer)
+    
+    # Generation runs on its own stream so it does not serialize behind
+    # other work queued on the default stream
+    generate_stream = torch.cuda.Stream()
+    
     print("Model loaded successfully")
 
+def load_vllm_engine(model_name):
+    """
+    Start the vLLM engine; the processor is still used for chat templating
+    """
+    global engine, sampling_params
+    
+    from vllm import AsyncLLMEngine, AsyncEngineArgs, SamplingParams
+    from vllm.sampling_params import GuidedDecodingParams
+    
+    if QUANTIZATION == "int8":
+        raise ValueError("int8 (bitsandbytes) is only supported with --backend transformers")
+    
+    # The AWQ checkpoint's own quantization config is auto-detected, which
+    # picks the awq_marlin kernels where the GPU supports them; forcing
+    # "awq" would pin the slower plain AWQ GEMM
+    engine = AsyncLLMEngine.from_engine_args(AsyncEngineArgs(
+        model=model_name,
+        quantization=None if QUANTIZATION == "awq" else QUANTIZATION,
+        dtype="float16",
+        tensor_parallel_size=torch.cuda.device_count(),
+        max_num_seqs=32,
+        mm_processor_kwargs={"min_pixels": MIN_PIXELS, "max_pixels": MAX_PIXELS},
+        trust_remote_code=True
+    ))
+    
+    # Guided decoding keeps every completion a valid KPIResponse document
+    sampling_params = SamplingParams(
+        temperature=0,
+        max_tokens=2048,
+        guided_decoding=GuidedDecodingParams(json=KPI_SCHEMA)
+    )
+
+def decode_images(raw_images):
+    """
+    Decode uploaded page images to RGB PIL images
+    """
+    pil_images = []
+    for raw in raw_images:
+        # Shrinking before convert() lets JPEGs decode at reduced scale
+        pil_image = Image.open(BytesIO(raw))
+        pil_images.append(fit_pixel_budget(pil_image).convert('RGB'))
+    
+    return pil_images
+
+def fit_pixel_budget(pil_image):
+    """
+    Downscale a page (in place) to at most MAX_PIXELS
+    
+    The processor resizes every page into this budget anyway, so the model
+    sees the same resolution; doing it here with LANCZOS just keeps full
+    300 DPI renders out of the processor and the host-to-device copy.
+    """
+    width, height = pil_image.size
+    scale = (MAX_PIXELS / (width * height)) ** 0.5
+    if scale < 1:
+        pil_image.thumbnail((int(width * scale), int(height * scale)), Image.Resampling.LANCZOS)
+    return pil_image
+
+@functools.lru_cache(maxsize=128)
+def chat_prompt(prompt):
+    """
+    Chat-templated text for one image + prompt
+    
+    The template only emits image placeholder tokens, so the result depends
+    on the prompt alone and is reused across pages with the same prompt.
+    """
+    messages = [
+        {
+            "role": "user",
+            "content": [
+                {"type": "image"},
+                {"type": "text", "text": prompt}
+            ]
+        }
+    ]
+    return processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+
+def json_constraint():
+    """
+    Logits constraint for HF generate that only admits KPI_SCHEMA-conformant JSON
+    """
+    from lmformatenforcer import JsonSchemaParser
+    from lmformatenforcer.integrations.transformers import build_transformers_prefix_allowed_tokens_fn
+    
+    return build_transformers_prefix_allowed_tokens_fn(tokenizer_data, JsonSchemaParser(KPI_SCHEMA))
+
+class TokenBudgetBatcher:
+    """
+    Split a batch into sub-batches of similar prompt length
+    
+    Requests are sorted by token count and packed greedily while the padded
+    attention cost (rows x longest prompt^2) stays within the budget, so
+    short pages are not padded up to long ones.
+    """
+    
+    def __init__(self, budget):
+        self.budget = budget
+    
+    def split(self, n_tokens):
+        """
+        Index lists into n_tokens, shortest prompts first
+        """
+        batches = []
+        batch = []
+        for i in sorted(range(len(n_tokens)), key=n_tokens.__getitem__):
+            # Sorted ascending, so the newest item is the longest in the batch
+            if batch and (len(batch) + 1) * n_tokens[i] ** 2 > self.budget:
+                batches.append(batch)
+                batch = []
+            batch.append(i)
+        if batch:
+            batches.append(batch)
+        return batches
+
+batcher = TokenBudgetBatcher(TOKEN_BUDGET)
+
+@functools.lru_cache(maxsize=128)
+def text_tokens(text):
+    """
+    Token count of a chat-templated prompt (image placeholder included)
+    """
+    return len(processor.tokenizer(text).input_ids)
+
+def count_tokens(text, pil_image):
+    """
+    Prompt length in tokens: template text plus the page's vision tokens
+    """
+    from transformers.models.qwen2_vl.image_processing_qwen2_vl import smart_resize
+    
+    height, width = smart_resize(
+        pil_image.height, pil_image.width,
+        factor=28, min_pixels=MIN_PIXELS, max_pixels=MAX_PIXELS
+    )
+    return text_tokens(text) + height * width // (28 * 28)
+
+def generate_budgeted(texts, pil_images):
+    """
+    Generate for a batch in length-grouped sub-batches, returning completions
+    in the original order
+    """
+    n_tokens = [count_tokens(text, pil_image) for text, pil_image in zip(texts, pil_images)]
+    
+    generated_texts = [None] * len(texts)
+    for indices in batcher.split(n_tokens):
+        outputs = generate_batch([texts[i] for i in indices], [pil_images[i] for i in indices])
+        for i, output in zip(indices, outputs):
+            generated_texts[i] = output
+    
+    return generated_texts
+
+def generate_batch(texts, pil_images):
+    """
+    Run one padded transformers generate call and return the decoded completions
+    
+    Blocking; called through asyncio.to_thread so the event loop keeps
+    reading and decoding uploads meanwhile.
+    """
+    with generate_lock, torch.inference_mode(), torch.cuda.stream(generate_stream):
+        # The attention mask from the processor keeps padding out of attention
+        inputs = processor(
+            text=texts,
+            images=pil_images,
+            padding=True,
+            return_tensors="pt"
+        ).to(model.device)
+        
+        output_ids = model.generate(
+            **inputs,
+            max_new_tokens=2048,
+            do_sample=False,
+            prefix_allowed_tokens_fn=json_constraint()
+        )
+        
+        # Results are read on the default stream below
+        generate_stream.synchronize()
+    
+    # Drop the (left-padded) prompt tokens before decoding
+    return processor.batch_decode(
+        output_ids[:, inputs.input_ids.shape[1]:],
+        skip_special_tokens=True,
+        clean_up_tokenization_spaces=False
+    )
+
+async def vllm_generate(text, pil_image):
+    """
+    Generate a completion for one prompt + image through the vLLM engine
+    """
+    final = None
+    async for output in engine.generate(
+        {"prompt": text, "multi_modal_data": {"image": pil_image}},
+        sampling_params,
+        request_id=uuid.uuid4().hex
+    ):
+        final = output
+    
+    return final.outputs[0].text
+
 @app.on_event("startup")
 async def startup_event():
     """
@@ -63,9 +373,9 @@ async def health_check():
     """
     return {
         "status": "healthy",
-        "model_loaded": model is not None,
-        "gpu_available": torch.cuda.is_available(),
-        "gpu_count": torch.cuda.device_count()
+        "model_loaded": model is not None or engine is not None,
+        "gpu_available": torch is not None and torch.cuda.is_available(),
+        "gpu_count": torch.cuda.device_count() if torch is not None else 0
     }
 
 @app.post("/extract")
@@ -76,60 +386,26 @@ async def extract_kpis(
     """
     Extract KPIs from a single image
     """
-    if model is None:
+    if model is None and engine is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
     try:
         # Read image
         image_bytes = await image.read()
-        pil_image = Image.open(BytesIO(image_bytes)).convert('RGB')
+        pil_image = (await asyncio.to_thread(decode_images, [image_bytes]))[0]
         
         # Prepare input
-        messages = [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "image", "image": pil_image},
-                    {"type": "text", "text": prompt}
-                ]
-            }
-        ]
-        
-        # Process
-        text = processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-        inputs = processor(
-            text=[text],
-            images=[pil_image],
-            return_tensors="pt"
-        ).to(model.device)
-        
-        # Generate
-        with torch.no_grad():
-            output_ids = model.generate(
-                **inputs,
-                max_new_tokens=2048,
-                do_sample=False
-            )
+        text = chat_prompt(prompt)
         
-        # Decode
-        generated_text = processor.batch_decode(
-            output_ids,
-            skip_special_tokens=True,
-            clean_up_tokenization_spaces=False
-        )[0]
-        
-        # Extract JSON from response
-        if '```json' in generated_text:
-            json_text = generated_text.split('```json')[1].split('```')[0].strip()
-        elif '```' in generated_text:
-            json_text = generated_text.split('```')[1].split('```')[0].strip()
+        if engine is not None:
+            generated_text = await vllm_generate(text, pil_image)
         else:
-            json_text = generated_text
+            generated_text = (await asyncio.to_thread(generate_batch, [text], [pil_image]))[0]
         
-        # Parse JSON
-        result = json.loads(json_text)
+        # Decoding was schema-constrained, so the output is the JSON document
+        result = orjson.loads(generated_text)
         
-        return JSONResponse(content=result)
+        return ORJSONResponse(content=result)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Extraction error: {str(e)}")
@@ -142,73 +418,67 @@ async def extract_batch(
     """
     Extract KPIs from multiple images in batch
     """
-    if model is None:
+    if model is None and engine is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
     try:
-        prompts_list = json.loads(prompts)
+        prompts_list = orjson.loads(prompts)
         
         if len(images) != len(prompts_list):
             raise HTTPException(status_code=400, detail="Number of images must match prompts")
         
+        batch_size = 20
+        
+        async def load_batch(start):
+            # Read all uploads of a batch concurrently, then decode off the loop
+            raw_images = await asyncio.gather(*(img.read() for img in images[start:start+batch_size]))
+            return await asyncio.to_thread(decode_images, list(raw_images))
+        
         results = []
         
-        # Process images in batches of 20
-        batch_size = 20
-        for i in range(0, len(images), batch_size):
-            batch_images = images[i:i+batch_size]
-            batch_prompts = prompts_list[i:i+batch_size]
-            
-            # Process batch
-            for img, prompt in zip(batch_images, batch_prompts):
-                image_bytes = await img.read()
-                pil_image = Image.open(BytesIO(image_bytes)).convert('RGB')
-                
-                messages = [
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "image", "image": pil_image},
-                            {"type": "text", "text": prompt}
-                        ]
-                    }
-                ]
+        # Process images in batches of 20; the next batch is read and decoded
+        # while the current one generates
+        next_batch = asyncio.create_task(load_batch(0)) if images else None
+        try:
+            for i in range(0, len(images), batch_size):
+                pil_images = await next_batch
+                if i + batch_size < len(images):
+                    next_batch = asyncio.create_task(load_batch(i + batch_size))
                 
-                text = processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-                inputs = processor(
-                    text=[text],
-                    images=[pil_image],
-                    return_tensors="pt"
-                ).to(model.device)
+                texts = [chat_prompt(prompt) for prompt in prompts_list[i:i+batch_size]]
                 
-                with torch.no_grad():
-                    output_ids = model.generate(
-                        **inputs,
-                        max_new_tokens=2048,
-                        do_sample=False
-                    )
-                
-                generated_text = processor.batch_decode(
-                    output_ids,
-                    skip_special_tokens=True,
-                    clean_up_tokenization_spaces=False
-                )[0]
-                
-                # Extract JSON
-                if '```json' in generated_text:
-                    json_text = generated_text.split('```json')[1].split('```')[0].strip()
-                elif '```' in generated_text:
-                    json_text = generated_text.split('```')[1].split('```')[0].strip()
+                if engine is not None:
+                    # vLLM batches concurrent requests itself (continuous batching)
+                    generated_texts = await asyncio.gather(*(
+                        vllm_generate(text, pil_image) for text, pil_image in zip(texts, pil_images)
+                    ))
                 else:
-                    json_text = generated_text
+                    generated_texts = await asyncio.to_thread(generate_budgeted, texts, pil_images)
                 
-                result = json.loads(json_text)
-                results.append(result)
+                results.extend(orjson.loads(generated_text) for generated_text in generated_texts)
+        finally:
+            # A failed generation must not leave the prefetch running or its
+            # exception unretrieved
+            if next_batch is not None:
+                next_batch.cancel()
+                await asyncio.gather(next_batch, return_exceptions=True)
         
-        return JSONResponse(content={"results": results})
+        return ORJSONResponse(content={"results": results})
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Batch extraction error: {str(e)}")
 
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='KPI extraction server')
+    parser.add_argument('--quantization', choices=sorted(MODEL_VARIANTS), default=QUANTIZATION,
+                       help='Weight quantization mode (default: awq)')
+    parser.add_argument('--backend', choices=['vllm', 'transformers'], default=BACKEND,
+                       help='Inference backend (default: vllm)')
+    
+    args = parser.parse_args()
+    QUANTIZATION = args.quantization
+    BACKEND = args.backend
+    
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
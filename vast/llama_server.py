@@ -4,24 +4,53 @@ Runs on Vast.ai RTX 3090 instances for Stage 1
 """
 
 import os
-import json
+import orjson
 from typing import Dict
-import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
 import uvicorn
 
-app = FastAPI(title="Page Validation Server")
+app = FastAPI(title="Page Validation Server", default_response_class=ORJSONResponse)
+
+# torch is imported by load_model(), so that importing this module and
+# uvicorn startup stay fast
+torch = None
 
 model = None
 tokenizer = None
+tokenizer_data = None
+instruction_ids = None
+generate_stream = None
+
+# Fixed instruction appended to every validation prompt
+INSTRUCTION = "\n\nRespond with valid JSON only."
+
+MAX_NEW_TOKENS = 2048
+
+# Response schema enforced during decoding (see Stage 1 _call_llm_validation)
+class PageValidation(BaseModel):
+    has_operational_kpis: bool
+    has_disclosures: bool
+    is_financial_statement: bool
+    confidence: float
+    reasoning: str = ""
+
+class ValidationResponse(BaseModel):
+    validations: Dict[str, PageValidation]
+
+VALIDATION_SCHEMA = ValidationResponse.model_json_schema()
 
 def load_model():
     """
     Load Llama 3.2 3B model
     """
-    global model, tokenizer
+    global model, tokenizer, tokenizer_data, instruction_ids, generate_stream
+    global torch
+    
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    from lmformatenforcer.integrations.transformers import build_token_enforcer_tokenizer_data
     
     print("Loading Llama 3.2 3B model...")
     
@@ -29,13 +58,25 @@ def load_model():
     
     tokenizer = AutoTokenizer.from_pretrained(model_name)
     
+    # Token vocabulary index for JSON-constrained decoding, built once
+    tokenizer_data = build_token_enforcer_tokenizer_data(tokenizer)
+    
+    # The instruction is the same on every request; tokenize it once
+    instruction_ids = tokenizer(INSTRUCTION, add_special_tokens=False, return_tensors="pt").input_ids
+    
     model = AutoModelForCausalLM.from_pretrained(
         model_name,
         torch_dtype=torch.float16,
-        device_map="auto"
+        device_map="auto",
+        use_safetensors=True,
+        low_cpu_mem_usage=True
     )
     
     model.eval()
+    
+    # Generation runs on its own stream, off the default stream
+    generate_stream = torch.cuda.Stream()
+    
     print("Model loaded successfully")
 
 @app.on_event("startup")
@@ -62,41 +103,37 @@ async def validate_pages(request: dict):
         page_texts = request.get('page_texts', {})
         prompt = request.get('prompt', '')
         
-        # Build full prompt
-        full_prompt = f"{prompt}\n\nRespond with valid JSON only."
+        # Tokenize the request prompt only and append the instruction tokens
+        prompt_ids = tokenizer(prompt, return_tensors="pt").input_ids
+        prompt_len = prompt_ids.shape[1] + instruction_ids.shape[1]
         
-        # Tokenize
-        inputs = tokenizer(full_prompt, return_tensors="pt").to(model.device)
+        from lmformatenforcer import JsonSchemaParser
+        from lmformatenforcer.integrations.transformers import build_transformers_prefix_allowed_tokens_fn
         
         # Generate
-        with torch.no_grad():
+        with torch.inference_mode(), torch.cuda.stream(generate_stream):
+            input_ids = torch.cat([prompt_ids, instruction_ids], dim=1).to(model.device)
             outputs = model.generate(
-                **inputs,
-                max_new_tokens=2048,
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                use_cache=True,
+                max_new_tokens=MAX_NEW_TOKENS,
                 do_sample=False,
-                pad_token_id=tokenizer.eos_token_id
+                pad_token_id=tokenizer.eos_token_id,
+                prefix_allowed_tokens_fn=build_transformers_prefix_allowed_tokens_fn(
+                    tokenizer_data, JsonSchemaParser(VALIDATION_SCHEMA)
+                )
             )
         
-        # Decode
-        response_text = tokenizer.decode(outputs[0], skip_special_tokens=True)
-        
-        # Extract JSON
-        if '```json' in response_text:
-            json_text = response_text.split('```json')[1].split('```')[0].strip()
-        elif '```' in response_text:
-            json_text = response_text.split('```')[1].split('```')[0].strip()
-        else:
-            # Try to find JSON in response
-            start = response_text.find('{')
-            end = response_text.rfind('}') + 1
-            if start != -1 and end > start:
-                json_text = response_text[start:end]
-            else:
-                json_text = response_text
+        # Only sync the generation stream before reading the result back
+        generate_stream.synchronize()
         
-        result = json.loads(json_text)
+        # Decode the generated tokens only; decoding was schema-constrained,
+        # so they are the JSON document
+        response_text = tokenizer.decode(outputs[0, prompt_len:], skip_special_tokens=True)
+        result = orjson.loads(response_text)
         
-        return JSONResponse(content=result)
+        return ORJSONResponse(content=result)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Validation error: {str(e)}")
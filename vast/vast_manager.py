@@ -7,10 +7,16 @@ Implements 'Fast Start' logic using public base images and runtime git cloning
 import os
 import sys
 import json
+import gzip
 import time
-import requests
+import base64
+import queue
+import threading
+import httpx
 import urllib.parse
-from typing import Optional, Dict, Any, List
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Callable
 
 # Add parent directory to path to allow imports from root
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -19,27 +25,111 @@ from scripts.utils import load_settings
 import logging
 logger = logging.getLogger(__name__)
 
+CACHE_DIR = Path.home() / ".cache" / "financial-extraction"
+
+# Recent interruptible (spot) clearing prices per GPU type, used to seed bids
+SPOT_PRICE_FILE = CACHE_DIR / "spot_prices.json"
+
+# Last successfully launched offer per mode, retried before searching
+OFFER_CACHE_FILE = CACHE_DIR / "offers.json"
+OFFER_CACHE_TTL = 1800
+
+# Seconds a /bundles search response is reused (back-to-back stage launches)
+SEARCH_CACHE_TTL = 15
+
+class _RetryTransport(httpx.HTTPTransport):
+    """HTTP/2 transport retrying connect failures and 502/503/504 responses"""
+
+    def __init__(self, retries: int = 3, backoff_factor: float = 0.3, **kwargs):
+        super().__init__(http2=True, retries=retries, **kwargs)
+        self.status_retries = retries
+        self.backoff_factor = backoff_factor
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        for attempt in range(self.status_retries + 1):
+            response = super().handle_request(request)
+            if response.status_code not in (502, 503, 504) or attempt == self.status_retries:
+                return response
+            response.close()
+            time.sleep(self.backoff_factor * 2 ** attempt)
+
+# Queue marker: a background /health probe finished (see _wait_until_ready)
+_PROBE_DONE = object()
+
+class OfferUnavailableError(Exception):
+    """The offer was rejected at rent time (already taken, delisted, ...)"""
+
 class VastManager:
     API_BASE = "https://console.vast.ai/api/v0"
 
-    def __init__(self, use_spot: bool = False):
+    # Shared /instances poller: one GET per interval for every instance being
+    # waited on in this process, fanned out to a queue per instance id
+    _pending: Dict[int, queue.Queue] = {}
+    _pending_lock = threading.Lock()
+    _poller_thread: Optional[threading.Thread] = None
+    _poll_attempt = 0
+
+    # Search URL -> (fetched at, offers), shared across instances and threads
+    _search_cache: Dict[str, tuple] = {}
+    _search_cache_lock = threading.Lock()
+
+    # Weights each server mode loads (see vast/entrypoint.sh)
+    MODE_MODELS = {
+        'page_selection': 'meta-llama/Llama-3.2-3B-Instruct',
+        'extraction': 'Qwen/Qwen2.5-VL-72B-Instruct-AWQ',
+        'verification': 'Qwen/Qwen2-VL-72B-Instruct-AWQ',
+    }
+
+    def __init__(self, use_spot: bool = False,
+                 settings_url_fn: Optional[Callable[[bytes], str]] = None):
         settings = load_settings()
         self.api_key = settings.get('vast_api_key')
         if not self.api_key:
             raise ValueError("Vast.ai API key not found in config/settings.json")
         
         self.use_spot = use_spot
-        # Public Base Image (Cached on 90% of hosts)
-        self.base_image = "pytorch/pytorch:2.1.2-cuda12.1-cudnn8-runtime"
+        # Pre-built server image (vast/Dockerfile) with every dependency baked
+        # in; without one, fall back to the public PyTorch image with the same
+        # torch as vast/requirements_vast.txt and install the rest at boot
+        self.server_image = settings.get('vast_server_image')
+        self.base_image = self.server_image or "pytorch/pytorch:2.5.1-cuda12.4-cudnn9-runtime"
+        
+        # Optional uploader: takes the settings.json bytes, stores them (e.g.
+        # S3) and returns a short-lived pre-signed GET URL for the instance
+        # to fetch at boot. Without it settings travel inline, gzipped.
+        self.settings_url_fn = settings_url_fn
+        
+        # One HTTP/2 client for every API call: the concurrent offer searches,
+        # the instance poller and re-bids multiplex over a single connection
+        # (httpx.Client is thread-safe)
+        self.client = httpx.Client(
+            transport=_RetryTransport(limits=httpx.Limits(max_connections=16, max_keepalive_connections=4)),
+            auth=self._authorize
+        )
+        
+        # Growth factor for status/health polling intervals (see _poll_delay)
+        self.poll_backoff_base = 1.3
+        
+        # instance_id -> (current bid, max price) for spot instances
+        self._bids = {}
         
         self._verify_auth()
 
+    def close(self):
+        """Release pooled connections"""
+        self.client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
     def _verify_auth(self):
         """Verify we can connect to Vast API"""
         try:
             url = f"{self.API_BASE}/users/current/"
-            headers = {"Authorization": f"Bearer {self.api_key}"}
-            response = requests.get(url, headers=headers, timeout=10)
+            response = self.client.get(url, timeout=10)
             if response.status_code == 200:
                 logger.info("Vast API authentication successful")
             else:
@@ -53,6 +143,20 @@ class VastManager:
             "Content-Type": "application/json"
         }
 
+    def _authorize(self, request: httpx.Request) -> httpx.Request:
+        """Client auth hook; calls made with auth=None don't carry the API key"""
+        request.headers.update(self._get_headers())
+        return request
+
+    def _settings_command(self, settings: Dict[str, Any]) -> str:
+        """Shell line that writes settings.json on the instance"""
+        payload = json.dumps(dict(settings)).encode()
+        if self.settings_url_fn:
+            url = self.settings_url_fn(payload)
+            return f'curl -sSf "{url}" -o /workspace/app/config/settings.json'
+        encoded = base64.b64encode(gzip.compress(payload)).decode()
+        return f"echo '{encoded}' | base64 -d | gunzip > /workspace/app/config/settings.json"
+
     def _get_onstart_script(self, mode: str) -> str:
         """
         Generates the bash script to run on instance boot.
@@ -76,16 +180,36 @@ class VastManager:
         else:
             auth_url = repo_url
             
-        json_content = json.dumps(settings).replace("'", "'\\''")
+        settings_cmd = self._settings_command(settings)
+
+        if self.server_image:
+            return self._get_prebuilt_onstart_script(mode, auth_url, settings_cmd)
 
         # UPDATED SCRIPT LOGIC
         script = f"""#!/bin/bash
 set -e
 echo "--- FAST START INIT ---"
 
-# 1. Install System Deps
+# Model cache on the instance's workspace volume (shared by the download
+# below and the server)
+export HF_HOME=/workspace/hf_cache
+mkdir -p $HF_HOME
+
+# 0. Start the model download immediately; it is the longest transfer and
+#    overlaps every step below. Own venv so it never races the main pip.
+(
+    python -m venv /tmp/hf && /tmp/hf/bin/pip install -q huggingface_hub && \\
+    /tmp/hf/bin/huggingface-cli download {self.MODE_MODELS.get(mode, '')}
+) > /tmp/model_download.log 2>&1 &
+MODEL_PID=$!
+
+# 1. Install System Deps (git first; the runtime libs install while cloning).
+#    No recommends: fewer bytes pulled and postinst hooks run on cold hosts.
+export DEBIAN_FRONTEND=noninteractive
 apt-get update -y
-apt-get install -y git libgl1-mesa-glx libglib2.0-0
+apt-get install -y --no-install-recommends git curl ca-certificates
+apt-get install -y --no-install-recommends libgl1-mesa-glx libglib2.0-0 &
+APT_PID=$!
 
 # 2. Clone Repository
 echo "Cloning code..."
@@ -96,42 +220,58 @@ else
     echo "Git clone failed. Check repo URL."
     exit 1
 fi
+wait $APT_PID || exit 1
 
 # 3. Inject Config
 echo "Injecting secure configuration..."
 mkdir -p /workspace/app/config
-echo '{json_content}' > /workspace/app/config/settings.json
+{settings_cmd}
 
-# 4. Install Python Deps (SMART CHECK)
+# 4. Install Python Deps (the pinned set the pre-built image bakes in)
 echo "Installing dependencies..."
 cd /workspace/app
+pip install --no-cache-dir --prefer-binary -r vast/requirements_vast.txt
 
-# CHECK FOR SERVER-SPECIFIC REQUIREMENTS FIRST
-if [ -f "requirements-server.txt" ]; then
-    echo "Found requirements-server.txt - Installing Server Deps Only..."
-    pip install --no-cache-dir -r requirements-server.txt
-elif [ -f "requirements.txt" ]; then
-    echo "Using standard requirements.txt..."
-    pip install --no-cache-dir -r requirements.txt
-else
-    echo "No requirements found, installing defaults..."
-    pip install --no-cache-dir fastapi uvicorn python-multipart transformers accelerate qwen_vl_utils tiktoken einops scipy matplotlib
+if ! wait $MODEL_PID; then
+    echo "Model pre-download failed (see /tmp/model_download.log); the server will fetch it on load"
 fi
 
-# 5. Start Application
+# 5. Start Application (server scripts from the checkout)
 echo "Starting application in mode: {mode}..."
 export EXTRACTION_MODE={mode}
+export SERVER_DIR=/workspace/app/vast
 export PYTHONPATH=$PYTHONPATH:/workspace/app
-
-if [ -f "entrypoint.sh" ]; then
-    bash entrypoint.sh
-else
-    echo "No entrypoint.sh found. Sleeping to keep container alive."
-    sleep infinity
-fi
+bash /workspace/app/vast/entrypoint.sh
 """
         return script
 
+    def _get_prebuilt_onstart_script(self, mode: str, auth_url: str, settings_cmd: str) -> str:
+        """
+        Boot script for the pre-built server image: dependencies are already
+        installed, so only fetch the current code, write config and start.
+        """
+        return f"""#!/bin/bash
+set -e
+echo "--- PREBUILT IMAGE INIT ---"
+export HF_HOME=/workspace/hf_cache
+mkdir -p $HF_HOME
+
+# 1. Fetch Current Code
+rm -rf /workspace/app
+git clone --depth 1 {auth_url} /workspace/app
+
+# 2. Inject Config
+mkdir -p /workspace/app/config
+{settings_cmd}
+
+# 3. Start Application (server scripts from the fresh checkout)
+echo "Starting application in mode: {mode}..."
+export EXTRACTION_MODE={mode}
+export SERVER_DIR=/workspace/app/vast
+export PYTHONPATH=$PYTHONPATH:/workspace/app
+bash /workspace/app/vast/entrypoint.sh
+"""
+
     def search_instances(self, gpu_type: str, gpu_count: int = 1, min_gpu_ram: int = 20):
         clean_gpu_name = gpu_type.replace('_', ' ')
         logger.info(f"Searching for {gpu_count}x {clean_gpu_name}...")
@@ -146,23 +286,26 @@ fi
             "inet_down": {"gte": 200},
             "reliability2": {"gte": 0.85}
         }
+        if self.use_spot:
+            # Interruptible offers, priced by min_bid
+            query["type"] = "bid"
         
         query_json = json.dumps(query)
         encoded_query = urllib.parse.quote(query_json)
         url = f"{self.API_BASE}/bundles?q={encoded_query}"
         
         try:
-            response = requests.get(url, headers=self._get_headers(), timeout=30)
-            response.raise_for_status()
-            offers = response.json().get('offers', [])
+            offers = self._fetch_offers(url)
             
-            filtered = []
-            for o in offers:
-                if o.get('gpu_name') != clean_gpu_name: continue
-                if o.get('num_gpus') != gpu_count: continue
-                if (o.get('gpu_ram', 0) / 1024) < min_gpu_ram: continue
-                filtered.append(o)
-
+            # gpu_name/num_gpus are already constrained by the query; this
+            # single pass is a guard, and gpu_ram is compared in MB directly
+            min_ram_mb = min_gpu_ram * 1024
+            filtered = [
+                o for o in offers
+                if o.get('gpu_name') == clean_gpu_name
+                and o.get('num_gpus') == gpu_count
+                and o.get('gpu_ram', 0) >= min_ram_mb
+            ]
             filtered.sort(key=lambda x: x['dph_total'])
             logger.info(f"Found {len(filtered)} matching offers for {clean_gpu_name}")
             return filtered
@@ -171,7 +314,88 @@ fi
             logger.error(f"Search failed: {e}")
             return []
     
-    def launch_instance(self, offer_id: int, mode: str, max_price: Optional[float] = None) -> Dict[str, Any]:
+    def _fetch_offers(self, url: str) -> List[Dict[str, Any]]:
+        """GET a /bundles search, reusing a response younger than SEARCH_CACHE_TTL"""
+        now = time.monotonic()
+        with VastManager._search_cache_lock:
+            cached = VastManager._search_cache.get(url)
+        if cached and now - cached[0] < SEARCH_CACHE_TTL:
+            return cached[1]
+        
+        response = self.client.get(url, timeout=30)
+        response.raise_for_status()
+        offers = response.json().get('offers', [])
+        
+        with VastManager._search_cache_lock:
+            VastManager._search_cache = {
+                k: v for k, v in VastManager._search_cache.items()
+                if now - v[0] < SEARCH_CACHE_TTL
+            }
+            VastManager._search_cache[url] = (now, offers)
+        return offers
+
+    def _forget_offer(self, offer_id: int):
+        """Drop an offer from every cached search response"""
+        with VastManager._search_cache_lock:
+            VastManager._search_cache = {
+                k: (ts, [o for o in offers if o.get('id') != offer_id])
+                for k, (ts, offers) in VastManager._search_cache.items()
+            }
+
+    def _offer_price(self, offer: Dict[str, Any]) -> float:
+        """Hourly price an offer can be had for: min_bid for spot, else dph_total"""
+        if self.use_spot:
+            return offer.get('min_bid') or offer['dph_total']
+        return offer['dph_total']
+
+    def _load_spot_prices(self) -> Dict[str, List[float]]:
+        try:
+            return json.loads(SPOT_PRICE_FILE.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def _record_spot_prices(self, offers: List[Dict[str, Any]]):
+        """Append clearing (min_bid) prices per GPU type (last 50 kept)"""
+        history = self._load_spot_prices()
+        for o in offers:
+            if o.get('min_bid'):
+                history.setdefault(o.get('gpu_name'), []).append(o['min_bid'])
+        history = {gpu: prices[-50:] for gpu, prices in history.items()}
+        try:
+            SPOT_PRICE_FILE.parent.mkdir(parents=True, exist_ok=True)
+            SPOT_PRICE_FILE.write_text(json.dumps(history))
+        except OSError as e:
+            logger.debug(f"Could not save spot prices: {e}")
+
+    def _initial_bid(self, offer: Dict[str, Any], max_price: float) -> float:
+        """Bid max(recent p90, min_bid * 1.1), never above max_price"""
+        recent = sorted(self._load_spot_prices().get(offer.get('gpu_name'), []))
+        p90 = recent[int(0.9 * (len(recent) - 1))] if recent else 0.0
+        return round(min(max_price, max(p90, self._offer_price(offer) * 1.1)), 4)
+
+    def _rebid(self, instance_id: int, price: float):
+        url = f"{self.API_BASE}/instances/bid_price/{instance_id}/"
+        response = self.client.put(url, json={"client_id": "me", "price": price}, timeout=30)
+        response.raise_for_status()
+        logger.info(f"Instance {instance_id} re-bid at ${price:.4f}/hr")
+
+    def _check_bid(self, instance_id: int, min_bid: Optional[float]):
+        """Raise the bid when the market's min_bid gets within 5% of ours"""
+        bid, max_price = self._bids[instance_id]
+        if not min_bid or min_bid <= bid * 0.95:
+            return
+        new_bid = round(min(max_price, min_bid * 1.1), 4)
+        if new_bid <= bid:
+            logger.warning(f"Instance {instance_id} is being outbid (min_bid ${min_bid:.4f}) at max price")
+            return
+        try:
+            self._rebid(instance_id, new_bid)
+            self._bids[instance_id] = (new_bid, max_price)
+        except httpx.HTTPError as e:
+            logger.warning(f"Re-bid for instance {instance_id} failed: {e}")
+
+    def launch_instance(self, offer_id: int, mode: str, max_price: Optional[float] = None,
+                        bid: Optional[float] = None) -> Dict[str, Any]:
         logger.info(f"Launching instance for {mode} (Fast Start)...")
         
         url = f"{self.API_BASE}/asks/{offer_id}/"
@@ -191,10 +415,18 @@ fi
             "runtype": "ssh",
             "use_jupyter_lab": False
         }
+        if self.use_spot:
+            # Interruptible: the price field is our bid
+            bid = bid or max_price
+            payload["price"] = bid
 
         try:
-            response = requests.put(url, headers=self._get_headers(), json=payload, timeout=30)
+            response = self.client.put(url, json=payload, timeout=30)
+            # Rented or rejected, it is no longer a candidate for cached searches
+            self._forget_offer(offer_id)
             
+            if 400 <= response.status_code < 500:
+                raise OfferUnavailableError(f"API Error {response.status_code}: {response.text}")
             if response.status_code >= 400:
                 raise Exception(f"API Error {response.status_code}: {response.text}")
                 
@@ -203,86 +435,269 @@ fi
                 raise Exception(f"Vast failure: {result}")
             
             instance_id = result.get('new_contract') or result.get('id')
+            if self.use_spot and bid:
+                self._bids[instance_id] = (bid, max_price or bid)
             logger.info(f"Instance {instance_id} launched. Bootstrapping environment...")
             return self.wait_for_instance(instance_id)
             
+        except OfferUnavailableError:
+            raise
         except Exception as e:
             raise Exception(f"Instance launch failed: {e}")
 
+    def _poll_delay(self, initial: float, cap: float, attempt: int) -> float:
+        """Exponential poll interval: initial * poll_backoff_base**attempt, capped"""
+        return min(cap, initial * self.poll_backoff_base ** attempt)
+
+    def _register_pending(self, instance_id: int) -> queue.Queue:
+        """Subscribe to status records for an instance; starts the poller if idle"""
+        q = queue.Queue()
+        with VastManager._pending_lock:
+            VastManager._pending[instance_id] = q
+            # A new launch gets fast early polls again
+            VastManager._poll_attempt = 0
+            poller = VastManager._poller_thread
+            if poller is None or not poller.is_alive():
+                VastManager._poller_thread = threading.Thread(
+                    target=self._poll_instances, name="vast-instance-poller", daemon=True
+                )
+                VastManager._poller_thread.start()
+        return q
+
+    def _unregister_pending(self, instance_id: int):
+        with VastManager._pending_lock:
+            VastManager._pending.pop(instance_id, None)
+
+    def _poll_instances(self):
+        """
+        Poller thread body. Each round fetches /instances once and puts the
+        matching record (or None) on every pending queue; a fatal client
+        error, or any unexpected failure, is put instead. Exits when nothing
+        is pending.
+        
+        The poller owns its client, so closing the manager that started it
+        does not break waits registered through other managers.
+        """
+        url = f"{self.API_BASE}/instances"
+        client = httpx.Client(transport=_RetryTransport(), headers=self._get_headers())
+        try:
+            while True:
+                with VastManager._pending_lock:
+                    pending = dict(VastManager._pending)
+                    if not pending:
+                        VastManager._poller_thread = None
+                        return
+                    attempt = VastManager._poll_attempt
+                    VastManager._poll_attempt += 1
+                
+                try:
+                    try:
+                        response = client.get(url, timeout=30)
+                    except httpx.RequestError:
+                        response = None
+                    
+                    # Client errors (bad key, unknown route) won't resolve by
+                    # waiting; 5xx, 429 and timeouts just back off
+                    if response is not None and 400 <= response.status_code < 500 and response.status_code != 429:
+                        error = Exception(f"Instance status check failed: {response.status_code} - {response.text}")
+                        for q in pending.values():
+                            q.put(error)
+                    elif response is not None and response.status_code == 200:
+                        instances = {i['id']: i for i in response.json().get('instances', [])}
+                        for instance_id, q in pending.items():
+                            q.put(instances.get(instance_id))
+                except Exception as e:
+                    for q in pending.values():
+                        q.put(e)
+                
+                time.sleep(self._poll_delay(2.0, 30.0, attempt))
+        finally:
+            client.close()
+            with VastManager._pending_lock:
+                if VastManager._poller_thread is threading.current_thread():
+                    VastManager._poller_thread = None
+
     def wait_for_instance(self, instance_id: int, timeout: int = 1200) -> Dict[str, Any]:
+        return self._wait_until_ready(instance_id, timeout)
+
+    @staticmethod
+    def _api_url(record: Dict[str, Any]) -> Optional[str]:
+        """Public URL of the instance's 8000/tcp mapping, once assigned"""
+        ports = record.get('ports')
+        if not isinstance(ports, dict) or not record.get('public_ipaddr'):
+            return None
+        mapping = ports.get('8000/tcp')
+        if mapping and isinstance(mapping, list) and mapping[0].get('HostPort'):
+            return f"http://{record['public_ipaddr']}:{mapping[0]['HostPort']}"
+        return None
+
+    def _probe_health(self, api_url: str) -> bool:
+        try:
+            # Don't send the Vast API key to the instance itself
+            return self.client.get(f"{api_url}/health", auth=None, timeout=3).status_code == 200
+        except httpx.RequestError:
+            return False
+
+    def _wait_until_ready(self, instance_id: int, timeout: int) -> Dict[str, Any]:
+        """
+        Wait for an instance to go pending -> running -> healthy in one loop.
+        Status records come from the shared /instances poller; as soon as a
+        record carries the port mapping, /health is probed in the background
+        on its own backoff, even before Vast reports running (its status can
+        lag), so neither check sleeps through the other.
+        """
         logger.info(f"Waiting for instance {instance_id} to bootstrap...")
-        start_time = time.time()
-        url = f"{self.API_BASE}/instances"
+        deadline = time.time() + timeout
+        phase = "pending"
+        target = None
+        api_url = None
+        probe = None
+        probe_attempt = 0
+        next_probe = 0.0
         
-        while time.time() - start_time < timeout:
-            try:
-                response = requests.get(url, headers=self._get_headers(), timeout=30)
-                if response.status_code == 200:
-                    instances = response.json().get('instances', [])
-                    target = next((i for i in instances if i['id'] == instance_id), None)
-                    
-                    if target and target.get('actual_status') == 'running':
-                        ssh_host = target.get('public_ipaddr')
-                        ports = target.get('ports', {})
-                        
-                        api_port = None
-                        if isinstance(ports, dict):
-                            mapping = ports.get('8000/tcp')
-                            if mapping and isinstance(mapping, list):
-                                api_port = mapping[0].get('HostPort')
-                        
-                        if api_port:
-                            api_url = f"http://{ssh_host}:{api_port}"
-                            if self._wait_for_health_check(api_url):
-                                return {
-                                    'instance_id': instance_id,
-                                    'api_url': api_url,
-                                    'price_per_hour': target.get('dph_total'),
-                                    'gpu_name': target.get('gpu_name'),
-                                    'gpu_count': target.get('num_gpus')
-                                }
-            except Exception:
-                pass
-            time.sleep(15)
+        updates = self._register_pending(instance_id)
+        prober = ThreadPoolExecutor(max_workers=1)
+        try:
+            while time.time() < deadline:
+                # Sleep until a status record or probe result arrives, or the
+                # next probe is due
+                wake = deadline
+                if api_url and probe is None:
+                    wake = min(wake, next_probe)
+                try:
+                    items = [updates.get(timeout=max(0.0, wake - time.time()))]
+                    while not updates.empty():
+                        items.append(updates.get_nowait())
+                except queue.Empty:
+                    items = []
+                
+                for item in items:
+                    if isinstance(item, Exception):
+                        raise item
+                    if item is not _PROBE_DONE and item:
+                        target = item
+                
+                if target and items:
+                    if instance_id in self._bids:
+                        self._check_bid(instance_id, target.get('min_bid'))
+                    api_url = self._api_url(target) or api_url
+                    if phase == "pending" and target.get('actual_status') == 'running':
+                        phase = "running"
+                        logger.info("  ...waiting for application server to start...")
+                
+                if probe is not None and probe.done():
+                    if probe.result():
+                        phase = "healthy"
+                        return {
+                            'instance_id': instance_id,
+                            'api_url': api_url,
+                            'price_per_hour': target.get('dph_total'),
+                            'gpu_name': target.get('gpu_name'),
+                            'gpu_count': target.get('num_gpus')
+                        }
+                    probe = None
+                    next_probe = time.time() + self._poll_delay(0.5, 15.0, probe_attempt)
+                    probe_attempt += 1
+                
+                if api_url and probe is None and time.time() >= next_probe:
+                    probe = prober.submit(self._probe_health, api_url)
+                    probe.add_done_callback(lambda _: updates.put(_PROBE_DONE))
+        finally:
+            prober.shutdown(wait=False)
+            self._unregister_pending(instance_id)
             
-        raise TimeoutError(f"Instance {instance_id} failed to start within {timeout}s")
-    
-    def _wait_for_health_check(self, api_url: str, timeout: int = 600) -> bool:
-        logger.info("  ...waiting for application server to start...")
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            try:
-                if requests.get(f"{api_url}/health", timeout=5).status_code == 200:
-                    return True
-            except:
-                pass
-            time.sleep(10)
-        return False
+        raise TimeoutError(f"Instance {instance_id} failed to start within {timeout}s ({phase})")
     
     def destroy_instance(self, instance_id: int):
         url = f"{self.API_BASE}/instances/{instance_id}/"
         try:
-            requests.delete(url, headers=self._get_headers(), timeout=30)
+            self.client.delete(url, timeout=30)
             logger.info(f"Instance {instance_id} destroyed")
         except Exception:
             pass
 
+    def _cheapest_offer(self, candidates: List[str], gpu_count: int, min_gpu_ram: int,
+                        max_price: float) -> Optional[Dict[str, Any]]:
+        """Search all candidate GPU types concurrently; cheapest affordable offer or None"""
+        with ThreadPoolExecutor(max_workers=len(candidates)) as ex:
+            results = ex.map(
+                lambda gpu: self.search_instances(gpu_type=gpu, gpu_count=gpu_count, min_gpu_ram=min_gpu_ram),
+                candidates
+            )
+            affordable = [o for result in results for o in result if self._offer_price(o) <= max_price]
+        best = min(affordable, key=self._offer_price, default=None)
+        if best and self.use_spot:
+            # Track what the offers we actually take clear at
+            self._record_spot_prices([best])
+        return best
+
+    def _load_cached_offer(self, mode: str) -> Optional[Dict[str, Any]]:
+        """Last offer launched for this mode, if younger than OFFER_CACHE_TTL"""
+        try:
+            cached = json.loads(OFFER_CACHE_FILE.read_text()).get(mode)
+        except (OSError, ValueError):
+            return None
+        if cached and time.time() - cached.get('ts', 0) < OFFER_CACHE_TTL:
+            return cached
+        return None
+
+    def _save_cached_offer(self, mode: str, offer: Dict[str, Any]):
+        try:
+            cache = json.loads(OFFER_CACHE_FILE.read_text())
+        except (OSError, ValueError):
+            cache = {}
+        cache[mode] = {
+            'id': offer['id'],
+            'host_id': offer.get('host_id'),
+            'gpu_name': offer.get('gpu_name'),
+            'dph_total': offer['dph_total'],
+            'min_bid': offer.get('min_bid'),
+            'ts': time.time()
+        }
+        try:
+            OFFER_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+            OFFER_CACHE_FILE.write_text(json.dumps(cache))
+        except OSError as e:
+            logger.debug(f"Could not save offer cache: {e}")
+
+    def _launch_offer(self, offer: Dict[str, Any], mode: str, max_price: float) -> Dict[str, Any]:
+        bid = self._initial_bid(offer, max_price) if self.use_spot else None
+        instance_info = self.launch_instance(offer['id'], mode, max_price, bid=bid)
+        self._save_cached_offer(mode, offer)
+        return instance_info
+
+    def _launch_cheapest(self, mode: str, candidates: List[str], gpu_count: int, min_gpu_ram: int,
+                         max_price: float) -> Optional[Dict[str, Any]]:
+        """
+        Launch the cached offer for this mode if it is still fresh and
+        affordable; otherwise (or if it was taken) launch the cheapest
+        offer found by a full search. None if nothing is available.
+        """
+        cached = self._load_cached_offer(mode)
+        if cached and self._offer_price(cached) <= max_price:
+            logger.info(f"Trying cached offer {cached['id']} ({cached.get('gpu_name')})...")
+            try:
+                return self._launch_offer(cached, mode, max_price)
+            except OfferUnavailableError as e:
+                logger.info(f"Cached offer no longer available ({e}); searching...")
+        
+        offer = self._cheapest_offer(candidates, gpu_count=gpu_count, min_gpu_ram=min_gpu_ram, max_price=max_price)
+        if offer:
+            return self._launch_offer(offer, mode, max_price)
+        return None
+
     def launch_for_stage1(self, max_price: float = 0.60) -> Dict[str, Any]:
         candidates = ['RTX_3090', 'RTX_4090', 'RTX_3080_Ti', 'RTX_3080', 'RTX_4080', 'RTX_A5000', 'RTX_A6000']
-        for gpu in candidates:
-            offers = self.search_instances(gpu_type=gpu, gpu_count=1, min_gpu_ram=10)
-            affordable = [o for o in offers if o['dph_total'] <= max_price]
-            if affordable:
-                return self.launch_instance(affordable[0]['id'], 'page_selection', max_price)
+        instance_info = self._launch_cheapest('page_selection', candidates, gpu_count=1, min_gpu_ram=10, max_price=max_price)
+        if instance_info:
+            return instance_info
         raise Exception("No GPUs found for Stage 1.")
     
     def launch_for_stage3(self, max_price: float = 5.00) -> Dict[str, Any]:
         candidates = ['A100_80GB', 'A100_SXM4_80GB', 'H100', 'RTX_A6000', 'RTX_6000_Ada']
-        for gpu in candidates:
-            offers = self.search_instances(gpu_type=gpu, gpu_count=2, min_gpu_ram=40)
-            affordable = [o for o in offers if o['dph_total'] <= max_price]
-            if affordable:
-                return self.launch_instance(affordable[0]['id'], 'extraction', max_price)
+        instance_info = self._launch_cheapest('extraction', candidates, gpu_count=2, min_gpu_ram=40, max_price=max_price)
+        if instance_info:
+            return instance_info
         raise Exception("No GPUs found for Stage 3.")
 
     def launch_for_stage5(self, max_price: float = 5.00) -> Dict[str, Any]:
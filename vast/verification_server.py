@@ -4,8 +4,14 @@ Similar to extraction but optimized for verification tasks
 """
 
 import os
+import re
 import json
+import uuid
+import asyncio
+import hashlib
+import functools
 from io import BytesIO
+from collections import OrderedDict
 from typing import List, Dict
 import torch
 from PIL import Image
@@ -16,42 +22,233 @@ import uvicorn
 
 app = FastAPI(title="KPI Verification Server")
 
+# JSON object inside a ```json / ``` fence, else the outermost {...} span
+_JSON_RE = re.compile(r"```(?:json)?\s*(\{.*?\})\s*```|(\{.*\})", re.S)
+
 model = None
 tokenizer = None
 processor = None
 
+# Image resolution bounds, as in extraction_server: 300 DPI page renders
+# would otherwise become ~11k vision tokens, past max_model_len
+MIN_PIXELS = 256 * 28 * 28
+MAX_PIXELS = 1280 * 28 * 28
+
+# Inference backend (--backend / INFERENCE_BACKEND env var), as in
+# extraction_server: vllm serves through AsyncLLMEngine (continuous batching
+# across in-flight /verify requests); transformers keeps the HF generate path.
+BACKEND = os.environ.get("INFERENCE_BACKEND", "vllm")
+engine = None
+sampling_params = None
+
+# transformers backend: /verify requests are queued and a single worker
+# micro-batches whatever is waiting into one padded generate call
+MAX_BATCH = 8
+request_queue = None
+worker_task = None
+
+# Identical /verify calls (same image, prompt and extractions) share one
+# in-flight generation, and finished results are kept in a small LRU;
+# decoding is greedy, so a repeat would produce the same answer
+RESULT_CACHE_SIZE = 256
+inflight = {}
+result_cache = OrderedDict()
+
+def _extract_json(text):
+    """
+    Pull the JSON document out of a model response in one regex pass
+    """
+    m = _JSON_RE.search(text)
+    return (m.group(1) or m.group(2)) if m else text
+
+def decode_image(image_bytes):
+    """
+    Decode an uploaded page to an RGB image of at most MAX_PIXELS
+    """
+    pil_image = Image.open(BytesIO(image_bytes)).convert('RGB')
+    
+    width, height = pil_image.size
+    scale = (MAX_PIXELS / (width * height)) ** 0.5
+    if scale < 1:
+        pil_image.thumbnail((int(width * scale), int(height * scale)), Image.Resampling.LANCZOS)
+    return pil_image
+
 def load_model():
     global model, tokenizer, processor
     
-    print("Loading Qwen2.5-VL-72B model for verification...")
+    print(f"Loading Qwen2.5-VL-72B model for verification ({BACKEND})...")
     
-    model_name = "Qwen/Qwen2-VL-72B-Instruct"
+    # Pre-quantized INT4 (AWQ) checkpoint: half the weight bytes of INT8 and
+    # fused GEMM kernels instead of bitsandbytes' outlier path
+    model_name = "Qwen/Qwen2-VL-72B-Instruct-AWQ"
     
     tokenizer = AutoTokenizer.from_pretrained(model_name)
-    processor = AutoProcessor.from_pretrained(model_name)
+    processor = AutoProcessor.from_pretrained(model_name, min_pixels=MIN_PIXELS, max_pixels=MAX_PIXELS)
+    
+    # Batched generation needs left padding so new tokens line up
+    processor.tokenizer.padding_side = "left"
+    
+    if BACKEND == "vllm":
+        load_vllm_engine(model_name)
+        print("Model loaded successfully")
+        return
     
     model = Qwen2VLForConditionalGeneration.from_pretrained(
         model_name,
         torch_dtype=torch.float16,
         device_map="auto",
-        load_in_8bit=True
+        attn_implementation="flash_attention_2",
+        use_safetensors=True,
+        low_cpu_mem_usage=True
     )
     
     model.eval()
     print("Model loaded successfully")
 
+def load_vllm_engine(model_name):
+    """
+    Start the vLLM engine; the processor is still used for chat templating
+    """
+    global engine, sampling_params
+    
+    from vllm import AsyncLLMEngine, AsyncEngineArgs, SamplingParams
+    
+    engine = AsyncLLMEngine.from_engine_args(AsyncEngineArgs(
+        model=model_name,
+        dtype="float16",
+        tensor_parallel_size=torch.cuda.device_count(),
+        gpu_memory_utilization=0.9,
+        max_model_len=8192,
+        limit_mm_per_prompt={"image": 1},
+        mm_processor_kwargs={"min_pixels": MIN_PIXELS, "max_pixels": MAX_PIXELS}
+    ))
+    sampling_params = SamplingParams(temperature=0, max_tokens=2048)
+
+async def vllm_generate(text, pil_image):
+    """
+    Generate a completion for one prompt + image through the vLLM engine
+    """
+    final = None
+    async for output in engine.generate(
+        {"prompt": text, "multi_modal_data": {"image": pil_image}},
+        sampling_params,
+        request_id=uuid.uuid4().hex
+    ):
+        final = output
+    
+    return final.outputs[0].text
+
+def generate_batch(texts, pil_images):
+    """
+    Run one padded generate call and return the decoded completions
+    """
+    inputs = processor(
+        text=texts,
+        images=pil_images,
+        padding=True,
+        return_tensors="pt"
+    ).to(model.device)
+    
+    with torch.no_grad():
+        output_ids = model.generate(
+            **inputs,
+            max_new_tokens=2048,
+            do_sample=False
+        )
+    
+    # Decode the generated tokens only; the prompt embeds the previous
+    # extractions as JSON and must not be matched later
+    return processor.batch_decode(
+        output_ids[:, inputs.input_ids.shape[1]:],
+        skip_special_tokens=True,
+        clean_up_tokenization_spaces=False
+    )
+
+async def worker_loop():
+    """
+    Serve queued (text, image, future) requests in micro-batches of up to
+    MAX_BATCH; generate runs in a thread so the event loop stays responsive
+    """
+    while True:
+        items = [await request_queue.get()]
+        while len(items) < MAX_BATCH:
+            try:
+                items.append(request_queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        
+        texts, pil_images, futures = zip(*items)
+        try:
+            generated_texts = await asyncio.to_thread(generate_batch, list(texts), list(pil_images))
+            for future, generated_text in zip(futures, generated_texts):
+                if not future.done():
+                    future.set_result(generated_text)
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+
 @app.on_event("startup")
 async def startup_event():
+    global request_queue, worker_task
+    
     load_model()
+    
+    if model is not None:
+        request_queue = asyncio.Queue()
+        worker_task = asyncio.create_task(worker_loop())
 
 @app.get("/health")
 async def health_check():
     return {
         "status": "healthy",
-        "model_loaded": model is not None,
+        "model_loaded": model is not None or engine is not None,
         "mode": "verification"
     }
 
+async def verify_page(image_bytes, prompt, extractions):
+    """
+    Run one verification and return the parsed JSON result
+    """
+    pil_image = await asyncio.to_thread(decode_image, image_bytes)
+    
+    # Build verification prompt
+    extractions_data = json.loads(extractions)
+    
+    verification_prompt = f"{prompt}\n\nPREVIOUS EXTRACTIONS:\n{json.dumps(extractions_data, indent=2)}"
+    
+    messages = [
+        {
+            "role": "user",
+            "content": [
+                {"type": "image", "image": pil_image},
+                {"type": "text", "text": verification_prompt}
+            ]
+        }
+    ]
+    
+    text = processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+    
+    if engine is not None:
+        generated_text = await vllm_generate(text, pil_image)
+    else:
+        future = asyncio.get_running_loop().create_future()
+        await request_queue.put((text, pil_image, future))
+        generated_text = await future
+    
+    return json.loads(_extract_json(generated_text))
+
+def finish_verification(key, task):
+    """
+    Retire an in-flight verification, caching its result if it succeeded
+    """
+    inflight.pop(key, None)
+    if task.cancelled() or task.exception() is not None:
+        return
+    result_cache[key] = task.result()
+    if len(result_cache) > RESULT_CACHE_SIZE:
+        result_cache.popitem(last=False)
+
 @app.post("/verify")
 async def verify_extraction(
     image: UploadFile = File(...),
@@ -61,58 +258,30 @@ async def verify_extraction(
     """
     Verify previous extractions
     """
-    if model is None:
+    if model is None and engine is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
     try:
         # Read image
         image_bytes = await image.read()
-        pil_image = Image.open(BytesIO(image_bytes)).convert('RGB')
-        
-        # Build verification prompt
-        extractions_data = json.loads(extractions)
         
-        verification_prompt = f"{prompt}\n\nPREVIOUS EXTRACTIONS:\n{json.dumps(extractions_data, indent=2)}"
+        key = hashlib.sha256(
+            b"\0".join([image_bytes, prompt.encode(), extractions.encode()])
+        ).hexdigest()
         
-        messages = [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "image", "image": pil_image},
-                    {"type": "text", "text": verification_prompt}
-                ]
-            }
-        ]
+        if key in result_cache:
+            result_cache.move_to_end(key)
+            return JSONResponse(content=result_cache[key])
         
-        text = processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-        inputs = processor(
-            text=[text],
-            images=[pil_image],
-            return_tensors="pt"
-        ).to(model.device)
+        task = inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(verify_page(image_bytes, prompt, extractions))
+            inflight[key] = task
+            task.add_done_callback(functools.partial(finish_verification, key))
         
-        with torch.no_grad():
-            output_ids = model.generate(
-                **inputs,
-                max_new_tokens=2048,
-                do_sample=False
-            )
-        
-        generated_text = processor.batch_decode(
-            output_ids,
-            skip_special_tokens=True,
-            clean_up_tokenization_spaces=False
-        )[0]
-        
-        # Extract JSON
-        if '```json' in generated_text:
-            json_text = generated_text.split('```json')[1].split('```')[0].strip()
-        elif '```' in generated_text:
-            json_text = generated_text.split('```')[1].split('```')[0].strip()
-        else:
-            json_text = generated_text
-        
-        result = json.loads(json_text)
+        # Shielded so one client disconnecting doesn't cancel the generation
+        # other identical requests are waiting on
+        result = await asyncio.shield(task)
         
         return JSONResponse(content=result)
         
@@ -120,4 +289,13 @@ async def verify_extraction(
         raise HTTPException(status_code=500, detail=f"Verification error: {str(e)}")
 
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='KPI verification server')
+    parser.add_argument('--backend', choices=['vllm', 'transformers'], default=BACKEND,
+                       help='Inference backend (default: vllm)')
+    
+    args = parser.parse_args()
+    BACKEND = args.backend
+    
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file